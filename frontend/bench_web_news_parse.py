@@ -0,0 +1,63 @@
+"""
+Benchmark for web news result parsing
+Compares full-document parsing against the targeted parser on saved Google News pages
+"""
+
+import glob
+import os
+import timeit
+
+from bs4 import BeautifulSoup
+
+from protest_monitor_agent import parse_web_news_results, WEB_NEWS_PARSER
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def parse_full_document(html):
+    """Previous implementation: parse the whole page, keep five BNeawe nodes"""
+    soup = BeautifulSoup(html, 'html.parser')
+    return [item.get_text() for item in soup.find_all('div', class_='BNeawe')[:5]]
+
+def parse_targeted_same_backend(html):
+    """Current implementation on the old backend: isolates the gain from slicing and straining"""
+    return parse_web_news_results(html, parser='html.parser')
+
+def parse_targeted(html):
+    """Current implementation: parse only the result blocks with the preferred backend"""
+    return parse_web_news_results(html)
+
+def benchmark(name, func, html, repeat=5, number=20):
+    """Return the best average time per call in milliseconds"""
+    best = min(timeit.repeat(lambda: func(html), repeat=repeat, number=number))
+    return best / number * 1000
+
+def main():
+    """Run the benchmark on every saved fixture"""
+    fixtures = sorted(glob.glob(os.path.join(FIXTURES_DIR, 'google_news_*.html')))
+    if not fixtures:
+        print(f"❌ No fixtures found in {FIXTURES_DIR}")
+        return
+
+    print(f"⏱️  WEB NEWS PARSE BENCHMARK (preferred backend: {WEB_NEWS_PARSER})")
+    print("=" * 50)
+    print("Note: the fixtures are synthetic pages mirroring Google's basic-HTML news layout")
+
+    for path in fixtures:
+        with open(path, 'rb') as f:
+            html = f.read()
+
+        full_ms = benchmark('full', parse_full_document, html)
+        same_backend_ms = benchmark('targeted_same_backend', parse_targeted_same_backend, html)
+        targeted_ms = benchmark('targeted', parse_targeted, html)
+        results = parse_targeted(html)
+
+        print(f"\n📄 {os.path.basename(path)} ({len(html) / 1024:.0f} KB)")
+        print(f"{'- Full document parse (html.parser):':<40} {full_ms:.2f} ms")
+        print(f"{'- Targeted parse (html.parser):':<40} {same_backend_ms:.2f} ms ({full_ms / same_backend_ms:.1f}x faster)")
+        print(f"{f'- Targeted parse ({WEB_NEWS_PARSER}):':<40} {targeted_ms:.2f} ms ({full_ms / targeted_ms:.1f}x faster)")
+        print(f"{'- Results extracted:':<40} {len(results)}")
+        for result in results[:2]:
+            print(f"  🌐 {result['url']} ({result['created_at'].isoformat()})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Enrichment pipeline for CPU-bound per-event work
+Runs sentiment scoring and text truncation on a process pool; theme tokenization
+stays in-process, where it is cheaper than pickling its token lists back
+
+Workers only need the chunk functions defined here, but multiprocessing still
+re-imports the caller's __main__ script in every worker (as __mp_main__), so
+entry points must keep their import-time work cheap and free of connections.
+"""
+
+import os
+import re
+import math
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Optional, Callable, Any
+
+from textblob import TextBlob
+
+MAX_TEXT_LENGTH = 500
+
+# Function words plus the generic protest vocabulary every event shares
+THEME_STOPWORDS = {
+    'a', 'about', 'after', 'again', 'against', 'all', 'also', 'am', 'an', 'and', 'any', 'are',
+    'around', 'as', 'at', 'be', 'because', 'been', 'before', 'being', 'between', 'both', 'but',
+    'by', 'can', 'could', 'did', 'do', 'does', 'doing', 'don', 'down', 'during', 'each', 'even',
+    'few', 'for', 'from', 'further', 'get', 'got', 'had', 'has', 'have', 'having', 'he', 'her',
+    'here', 'hers', 'him', 'his', 'how', 'however', 'if', 'in', 'into', 'is', 'it', 'its', 'just',
+    'like', 'many', 'may', 'me', 'more', 'most', 'much', 'must', 'my', 'new', 'no', 'nor', 'not',
+    'now', 'of', 'off', 'on', 'once', 'one', 'only', 'or', 'other', 'our', 'ours', 'out', 'over',
+    'own', 'said', 'same', 'says', 'she', 'should', 'so', 'some', 'such', 'than', 'that', 'the',
+    'their', 'theirs', 'them', 'then', 'there', 'these', 'they', 'this', 'those', 'through', 'to',
+    'too', 'under', 'until', 'up', 'very', 'via', 'was', 'we', 'were', 'what', 'when', 'where',
+    'which', 'while', 'who', 'whom', 'why', 'will', 'with', 'would', 'you', 'your', 'yours',
+    'amp', 'http', 'https', 'www', 'com', 'reddit', 'news', 'today', 'yesterday', 'week',
+    'protest', 'protests', 'protester', 'protesters', 'protesting', 'demonstration',
+    'demonstrations', 'demonstrator', 'demonstrators', 'march', 'marches', 'marched', 'rally',
+    'rallies'
+}
+THEME_TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9'-]*[a-z0-9]")
+
+def truncate_text(text: str) -> str:
+    """Truncate event text to MAX_TEXT_LENGTH characters"""
+    return text[:MAX_TEXT_LENGTH] + "..." if len(text) > MAX_TEXT_LENGTH else text
+
+def enrich_text(title: str, text: str) -> Tuple[float, str]:
+    """Sentiment polarity (rounded) and truncated text for one event"""
+    sentiment = TextBlob(f"{title} {text}").sentiment.polarity
+    return round(sentiment, 3), truncate_text(text)
+
+def enrich_chunk(items: List[Tuple[str, str]]) -> List[Tuple[float, Optional[str]]]:
+    """Enrich a chunk of (title, text) pairs; unchanged text is returned as None to save pickling"""
+    results = []
+    for title, text in items:
+        sentiment, truncated = enrich_text(title, text)
+        results.append((sentiment, truncated if truncated != text else None))
+    return results
+
+def theme_terms(text: str) -> List[str]:
+    """Unigram and bigram theme candidates from one event's text"""
+    terms = []
+    previous = None
+    for token in THEME_TOKEN_PATTERN.findall(text.lower()):
+        if len(token) < 3 or token in THEME_STOPWORDS:
+            # Bigrams never span a stopword ("police and people" is not a phrase)
+            previous = None
+            continue
+        terms.append(token)
+        if previous:
+            terms.append(f"{previous} {token}")
+        previous = token
+    return terms
+
+class EnrichmentPipeline:
+    """Splits events into chunks and maps them over a shared process pool, preserving order"""
+
+    def __init__(self, workers: Optional[int] = None, min_parallel: int = 200, chunks_per_worker: int = 4):
+        self.workers = workers or int(os.getenv('ENRICH_WORKERS', os.cpu_count() or 1))
+        # Below this many items the pool's IPC overhead outweighs the parallel speedup
+        self.min_parallel = min_parallel
+        self.chunks_per_worker = chunks_per_worker
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # forkserver/spawn avoid forking a process that has live stream threads
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context('forkserver')
+                    # Preload this module in the server; each worker still imports __main__ itself
+                    context.set_forkserver_preload([__name__])
+                else:
+                    context = multiprocessing.get_context('spawn')
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._pool
+
+    def map_chunks(self, func: Callable[[List[Any]], List[Any]], items: List[Any]) -> List[Any]:
+        """Apply a chunk function to items, in parallel when worthwhile; results keep input order"""
+        if not items:
+            return []
+        if self.workers <= 1 or len(items) < self.min_parallel:
+            return func(items)
+
+        # A few large chunks per worker: enough to balance load, few enough to keep pickling cheap
+        chunk_size = math.ceil(len(items) / (self.workers * self.chunks_per_worker))
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+        try:
+            results = []
+            for chunk_result in self._get_pool().map(func, chunks):
+                results.extend(chunk_result)
+            return results
+        except Exception as e:
+            print(f"Error in enrichment pool, falling back to a single process: {e}")
+            self.shutdown()
+            return func(items)
+
+    def enrich(self, items: List[Tuple[str, str]]) -> List[Tuple[float, str]]:
+        """Sentiment and truncated text for each (title, text) pair, in order"""
+        results = self.map_chunks(enrich_chunk, items)
+        return [
+            (sentiment, text if truncated is None else truncated)
+            for (sentiment, truncated), (_, text) in zip(results, items)
+        ]
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
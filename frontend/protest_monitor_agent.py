@@ -6,18 +6,29 @@ Monitors Reddit and news sources for protest-related activity in specific cities
 import os
 import re
 import json
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+import math
+import itertools
+import hashlib
+import heapq
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Callable, Tuple, Iterator
+from urllib.parse import urlparse, parse_qs
+from dataclasses import dataclass, field
 
 import praw
 import requests
 from newsapi import NewsApiClient
 from dotenv import load_dotenv
 from geopy.geocoders import Nominatim
-from textblob import TextBlob
 import pandas as pd
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+
+from enrichment import EnrichmentPipeline, enrich_text, theme_terms
 
 from strands_agents_sdk import Agent, tool, provider
 from strands_agents_sdk.providers import OpenAIProvider, AnthropicProvider
@@ -25,6 +36,35 @@ from strands_agents_sdk.providers import OpenAIProvider, AnthropicProvider
 # Load environment variables
 load_dotenv()
 
+# Keywords that mark a post as protest-related
+PROTEST_KEYWORDS = [
+    "protest", "demonstration", "rally", "march", "strike",
+    "activism", "demonstrators", "protesters", "civil disobedience",
+    "police", "arrest", "riot", "crowd", "gathering", "blm", "justice"
+]
+
+# Subreddits monitored for every city (city-specific subreddits are added per city)
+MONITORED_SUBREDDITS = [
+    "news", "worldnews", "politics", "PublicFreakout", "protest",
+    "activism", "Bad_Cop_No_Donut", "2020PoliceBrutality"
+]
+
+def city_subreddits(city: str) -> List[str]:
+    """Local subreddits for a city (e.g. r/newyork, r/newyorknews)"""
+    name = city.lower().replace(" ", "")
+    return [name, f"{name}news"]
+
+def merge_by_recency(*streams: Iterator[Dict]) -> Iterator[Dict]:
+    """Merge newest-first streams into one newest-first stream, skipping repeated IDs"""
+    # heapq.merge only pulls from a stream when its head is the newest remaining item,
+    # so a consumer that stops early never fetches pages it doesn't need
+    seen = set()
+    for item in heapq.merge(*streams, key=lambda item: item['created_at'], reverse=True):
+        if item['id'] in seen:
+            continue
+        seen.add(item['id'])
+        yield item
+
 @dataclass
 class ProtestEvent:
     """Data structure for protest events"""
@@ -50,144 +90,303 @@ class RedditAPI:
         self.client_id = os.getenv('REDDIT_CLIENT_ID')
         self.client_secret = os.getenv('REDDIT_CLIENT_SECRET')
         self.user_agent = os.getenv('REDDIT_USER_AGENT', 'protest_monitor_v1.0')
-        
-        if self.client_id and self.client_secret:
-            self.reddit = praw.Reddit(
+        self._reddit = None
+        self._reddit_checked = False
+        self._init_lock = threading.Lock()
+        self._local = threading.local()
+    
+    @property
+    def reddit(self):
+        """The main-thread praw client, created on first use so importing this module stays cheap"""
+        if not self._reddit_checked:
+            with self._init_lock:
+                if not self._reddit_checked:
+                    if self.client_id and self.client_secret:
+                        self._reddit = praw.Reddit(
+                            client_id=self.client_id,
+                            client_secret=self.client_secret,
+                            user_agent=self.user_agent
+                        )
+                    else:
+                        print("⚠️  Reddit credentials not found. Reddit search will be limited.")
+                    self._reddit_checked = True
+        return self._reddit
+    
+    def thread_client(self):
+        """A praw client owned by the calling thread (praw instances are not thread-safe)"""
+        if not self.reddit:
+            return None
+        if threading.current_thread() is threading.main_thread():
+            return self.reddit
+        if getattr(self._local, 'reddit', None) is None:
+            self._local.reddit = praw.Reddit(
                 client_id=self.client_id,
                 client_secret=self.client_secret,
                 user_agent=self.user_agent
             )
-        else:
-            self.reddit = None
-            print("⚠️  Reddit credentials not found. Reddit search will be limited.")
+        return self._local.reddit
     
     def search_protests(self, city: str, limit: int = 100) -> List[Dict]:
-        """Search for protest-related posts on Reddit"""
+        """Search for the newest protest-related posts on Reddit"""
+        return list(itertools.islice(self.iter_protests(city), limit))
+    
+    def iter_protests(self, city: str) -> Iterator[Dict]:
+        """Yield protest-related posts for a city, newest first"""
         if not self.reddit:
-            return []
+            return
         
-        protest_keywords = [
-            "protest", "demonstration", "rally", "march", "strike",
-            "activism", "demonstrators", "protesters", "civil disobedience",
-            "police", "arrest", "riot", "crowd", "gathering", "blm", "justice"
-        ]
+        # The shared subreddits are searched as one combined listing; the city's own
+        # subreddits are searched separately since they may not exist
+        subreddits = ["+".join(MONITORED_SUBREDDITS)] + city_subreddits(city)
         
-        # Search in relevant subreddits
-        subreddits = [
-            "news", "worldnews", "politics", "PublicFreakout", "protest",
-            "activism", "Bad_Cop_No_Donut", "2020PoliceBrutality",
-            city.lower().replace(" ", ""), f"{city.lower()}news"
+        streams = [
+            self._iter_search(subreddit_name, f"{city} {keyword}")
+            for subreddit_name in subreddits
+            for keyword in PROTEST_KEYWORDS[:5]  # Limit to avoid rate limits
         ]
         
-        posts = []
-        
+        # Filter after merging, not per stream: a stream whose posts never name the city
+        # (common in r/<city>) is then only read as far back as the merge has reached,
+        # instead of paging through every result before the merge can yield anything
+        city_lower = city.lower()
+        for post in merge_by_recency(*streams):
+            if city_lower in post['title'].lower() or city_lower in post['text'].lower():
+                yield post
+    
+    def _iter_search(self, subreddit_name: str, query: str) -> Iterator[Dict]:
+        """Yield every post from one search, newest first (pages are fetched lazily)"""
         try:
-            for subreddit_name in subreddits:
-                try:
-                    subreddit = self.reddit.subreddit(subreddit_name)
-                    
-                    # Search for city + protest keywords
-                    for keyword in protest_keywords[:5]:  # Limit to avoid rate limits
-                        query = f"{city} {keyword}"
-                        
-                        # Search hot posts
-                        for submission in subreddit.search(query, sort='hot', time_filter='month', limit=10):
-                            if city.lower() in submission.title.lower() or city.lower() in submission.selftext.lower():
-                                posts.append({
-                                    'id': submission.id,
-                                    'title': submission.title,
-                                    'text': submission.selftext,
-                                    'author': str(submission.author) if submission.author else 'unknown',
-                                    'created_at': datetime.fromtimestamp(submission.created_utc),
-                                    'score': submission.score,
-                                    'comments_count': submission.num_comments,
-                                    'url': f"https://reddit.com{submission.permalink}",
-                                    'subreddit': subreddit_name
-                                })
-                                
-                                if len(posts) >= limit:
-                                    return posts
-                                    
-                except Exception as e:
-                    print(f"Error searching subreddit {subreddit_name}: {e}")
-                    continue
+            subreddit = self.reddit.subreddit(subreddit_name)
+            
+            for submission in subreddit.search(query, sort='new', time_filter='month', limit=None):
+                yield self._submission_to_post(submission, str(submission.subreddit.display_name))
                     
         except Exception as e:
-            print(f"Error searching Reddit: {e}")
-            
-        return posts
+            print(f"Error searching subreddit {subreddit_name}: {e}")
+    
+    def stream_submissions(self, subreddits: List[str], stop_event: threading.Event,
+                           poll_interval: float = 15.0):
+        """Yield new submissions from the given subreddits as they are posted"""
+        if not self.reddit:
+            return
+        
+        # Runs on the stream thread, so it needs its own client rather than the shared one;
+        # one combined listing (r/a+b+c) polls all subreddits with a single request
+        combined = self.thread_client().subreddit("+".join(subreddits))
+        backoff = 1
+        
+        while not stop_event.is_set():
+            try:
+                # pause_after=0 yields None whenever a poll returns nothing new. praw resets its
+                # own backoff at that point, so wait here: the poll rate stays bounded (the rate
+                # limit is shared with searches and comment fetches) and stop() still interrupts it
+                for submission in combined.stream.submissions(skip_existing=True, pause_after=0):
+                    if stop_event.is_set():
+                        return
+                    if submission is None:
+                        stop_event.wait(poll_interval)
+                        continue
+                    backoff = 1
+                    yield submission
+                    
+            except Exception as e:
+                print(f"Error streaming Reddit submissions: {e}")
+                stop_event.wait(backoff)
+                backoff = min(backoff * 2, 60)
+    
+    @staticmethod
+    def _submission_to_post(submission, subreddit_name: str) -> Dict:
+        """Convert a praw submission into a post dict"""
+        return {
+            'id': submission.id,
+            'source': 'reddit',
+            'title': submission.title,
+            'text': submission.selftext,
+            'author': str(submission.author) if submission.author else 'unknown',
+            'created_at': datetime.fromtimestamp(submission.created_utc, tz=timezone.utc),
+            'score': submission.score,
+            'comments_count': submission.num_comments,
+            'url': f"https://reddit.com{submission.permalink}",
+            'subreddit': subreddit_name
+        }
+
+# Google News results (basic HTML layout): one container div per result with a
+# "/url?q=<article>" link, the title and source in BNeawe divs, and a snippet
+# that starts with the publish time ("3 hours ago", "Mar 3, 2024")
+WEB_NEWS_RESULT_CLASS = 'Gx5Zad'
+# While parsing, the class attribute is still the raw string, so match it as a word
+WEB_NEWS_RESULT_STRAINER = SoupStrainer('div', attrs={'class': re.compile(rf'\b{WEB_NEWS_RESULT_CLASS}\b')})
+WEB_NEWS_RESULT_START = re.compile(rf'<div class="{WEB_NEWS_RESULT_CLASS}[" ]'.encode())
+WEB_NEWS_LINK_STRAINER = SoupStrainer('a', href=re.compile(r'^/url\?'))
+
+try:
+    import lxml  # noqa: F401
+    WEB_NEWS_PARSER = 'lxml'
+except ImportError:
+    WEB_NEWS_PARSER = 'html.parser'
+
+RELATIVE_TIME_PATTERN = re.compile(
+    r'(\d+)\s+(sec(?:ond)?|min(?:ute)?|hour|hr|day|week|month|year)s?\.?\s+ago', re.IGNORECASE
+)
+ABSOLUTE_TIME_PATTERN = re.compile(r'\b([A-Z][a-z]{2}\s+\d{1,2},\s+\d{4}|\d{1,2}\s+[A-Z][a-z]{2}\s+\d{4})\b')
+RELATIVE_TIME_UNITS = {
+    'sec': timedelta(seconds=1), 'second': timedelta(seconds=1),
+    'min': timedelta(minutes=1), 'minute': timedelta(minutes=1), 'hour': timedelta(hours=1),
+    'hr': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1),
+    'month': timedelta(days=30), 'year': timedelta(days=365)
+}
+
+def parse_published_time(text: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Parse a search-result timestamp ("2 hours ago", "Mar 3, 2024") into an aware UTC datetime"""
+    now = now or datetime.now(timezone.utc)
+    
+    match = RELATIVE_TIME_PATTERN.search(text)
+    if match:
+        return now - int(match.group(1)) * RELATIVE_TIME_UNITS[match.group(2).lower()]
+    
+    match = ABSOLUTE_TIME_PATTERN.search(text)
+    if match:
+        for fmt in ('%b %d, %Y', '%d %b %Y'):
+            try:
+                return datetime.strptime(match.group(1), fmt).replace(tzinfo=timezone.utc)
+            except ValueError:
+                continue
+    
+    return None
+
+def _result_url(href: str) -> str:
+    """Unwrap Google's "/url?q=<article>&sa=..." redirect links"""
+    if href.startswith('/url?'):
+        return parse_qs(urlparse(href).query).get('q', [href])[0]
+    return href
+
+def parse_web_news_results(html, limit: int = 5, now: Optional[datetime] = None,
+                           parser: str = WEB_NEWS_PARSER) -> List[Dict]:
+    """Extract news results from a Google News results page, parsing only the result blocks"""
+    now = now or datetime.now(timezone.utc)
+    results = []
+    
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    
+    # Cut the page down to the first `limit` result blocks before parsing, which
+    # skips the head (inline styles and scripts), navigation and footer entirely
+    starts = [m.start() for m in itertools.islice(WEB_NEWS_RESULT_START.finditer(html), limit + 1)]
+    if starts:
+        fragment = html[starts[0]:starts[limit]] if len(starts) > limit else html[starts[0]:]
+        blocks = BeautifulSoup(fragment, parser, parse_only=WEB_NEWS_RESULT_STRAINER).find_all(
+            'div', class_=WEB_NEWS_RESULT_CLASS, limit=limit
+        )
+    else:
+        blocks = []
+    
+    if not blocks:
+        # Layout changed: fall back to the redirect links themselves
+        blocks = BeautifulSoup(html, parser, parse_only=WEB_NEWS_LINK_STRAINER).find_all('a', limit=limit)
+    
+    for block in blocks:
+        link = block if block.name == 'a' else block.find('a', href=True)
+        if link is None:
+            continue
+        
+        heading = link.find_all('div', class_='BNeawe', limit=2)
+        title = heading[0].get_text(' ', strip=True) if heading else link.get_text(' ', strip=True)
+        source = heading[1].get_text(' ', strip=True) if len(heading) > 1 else 'web_search'
+        
+        snippet_node = block.find('div', class_='s3v9rd') if block is not link else None
+        snippet = snippet_node.get_text(' ', strip=True) if snippet_node else ''
+        
+        results.append({
+            'url': _result_url(link['href']),
+            'title': title,
+            'text': snippet,
+            'news_source': source,
+            'created_at': parse_published_time(snippet, now) or now
+        })
+    
+    return results
 
 class NewsAPI:
     """News API wrapper for protest monitoring"""
     
     def __init__(self):
         self.api_key = os.getenv('NEWS_API_KEY')
-        if self.api_key:
-            self.client = NewsApiClient(api_key=self.api_key)
-        else:
-            self.client = None
-            print("⚠️  News API key not found. Will use alternative news sources.")
+        self._client = None
+        self._client_checked = False
         
         self.geolocator = Nominatim(user_agent="protest_monitor")
     
+    @property
+    def client(self):
+        """The NewsAPI client, created on first use so importing this module stays cheap"""
+        if not self._client_checked:
+            if self.api_key:
+                self._client = NewsApiClient(api_key=self.api_key)
+            else:
+                print("⚠️  News API key not found. Will use alternative news sources.")
+            self._client_checked = True
+        return self._client
+    
     def search_protests(self, city: str, limit: int = 100) -> List[Dict]:
-        """Search for protest-related news articles"""
-        articles = []
-        
-        # Try NewsAPI first
-        if self.client:
-            articles.extend(self._search_newsapi(city, limit // 2))
-        
-        # Fallback to web scraping
-        articles.extend(self._search_web_news(city, limit // 2))
-        
-        return articles[:limit]
+        """Search for the newest protest-related news articles"""
+        return list(itertools.islice(self.iter_protests(city), limit))
     
-    def _search_newsapi(self, city: str, limit: int) -> List[Dict]:
+    def iter_protests(self, city: str) -> Iterator[Dict]:
+        """Yield protest-related news articles for a city, newest first"""
+        # NewsAPI when configured, plus the web scraping fallback
+        yield from merge_by_recency(self._iter_newsapi(city), self._iter_web_news(city))
+    
+    def _iter_newsapi(self, city: str) -> Iterator[Dict]:
         """Search using NewsAPI"""
         if not self.client:
-            return []
+            return
             
         protest_keywords = ["protest", "demonstration", "rally", "march", "strike", "activism"]
-        articles = []
         
+        streams = [
+            self._iter_newsapi_query(f"{city} {keyword}", city)
+            for keyword in protest_keywords[:3]  # Limit API calls
+        ]
+        yield from merge_by_recency(*streams)
+    
+    def _iter_newsapi_query(self, query: str, city: str, page_size: int = 20, max_pages: int = 5) -> Iterator[Dict]:
+        """Yield matching articles for one query, newest first (pages are fetched lazily)"""
         try:
-            for keyword in protest_keywords[:3]:  # Limit API calls
-                query = f"{city} {keyword}"
-                
+            for page in range(1, max_pages + 1):
                 response = self.client.get_everything(
                     q=query,
                     language='en',
                     sort_by='publishedAt',
-                    from_param=(datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'),
-                    page_size=min(20, limit)
+                    from_param=(datetime.now(timezone.utc) - timedelta(days=30)).strftime('%Y-%m-%d'),
+                    page_size=page_size,
+                    page=page
                 )
                 
                 for article in response['articles']:
                     if city.lower() in article['title'].lower() or city.lower() in (article['description'] or '').lower():
-                        articles.append({
+                        yield {
                             'id': article['url'],
+                            'source': 'news',
                             'title': article['title'],
                             'text': article['description'] or '',
                             'author': article['author'] or 'unknown',
-                            'created_at': datetime.fromisoformat(article['publishedAt'].replace('Z', '+00:00')),
+                            'created_at': parse_event_time(article['publishedAt']),
                             'score': 0,  # News doesn't have scores
                             'comments_count': 0,
                             'url': article['url'],
                             'news_source': article['source']['name']
-                        })
-                        
-                        if len(articles) >= limit:
-                            return articles
+                        }
+                
+                if len(response['articles']) < page_size:
+                    return
                             
         except Exception as e:
             print(f"Error with NewsAPI: {e}")
-            
-        return articles
     
-    def _search_web_news(self, city: str, limit: int) -> List[Dict]:
-        """Fallback web scraping for news"""
+    def _iter_web_news(self, city: str) -> Iterator[Dict]:
+        """Fallback web scraping for news, newest first"""
         articles = []
+        seen_urls = set()
         
         # Google News search (simplified)
         try:
@@ -204,28 +403,25 @@ class NewsAPI:
                 try:
                     response = requests.get(search_url, headers=headers, timeout=10)
                     if response.status_code == 200:
-                        soup = BeautifulSoup(response.content, 'html.parser')
-                        
-                        # Simple extraction (this is a basic implementation)
-                        news_items = soup.find_all('div', class_='BNeawe')[:5]
-                        
-                        for item in news_items:
-                            text = item.get_text()
-                            if city.lower() in text.lower() and any(p in text.lower() for p in protest_terms):
+                        # Only the result blocks are parsed; the rest of the page is skipped
+                        for result in parse_web_news_results(response.content):
+                            text = f"{result['title']} {result['text']}".lower()
+                            if result['url'] in seen_urls:
+                                continue
+                            if city.lower() in text and any(p in text for p in protest_terms):
+                                seen_urls.add(result['url'])
                                 articles.append({
-                                    'id': f"web_{len(articles)}",
-                                    'title': text[:100],
-                                    'text': text,
+                                    'id': result['url'],
+                                    'source': 'news',
+                                    'title': result['title'],
+                                    'text': result['text'] or result['title'],
                                     'author': 'web_search',
-                                    'created_at': datetime.now(),
+                                    'created_at': result['created_at'],
                                     'score': 0,
                                     'comments_count': 0,
-                                    'url': search_url,
-                                    'news_source': 'web_search'
+                                    'url': result['url'],
+                                    'news_source': result['news_source']
                                 })
-                                
-                                if len(articles) >= limit:
-                                    return articles
                                     
                 except Exception as e:
                     print(f"Error scraping web news: {e}")
@@ -233,81 +429,1004 @@ class NewsAPI:
                     
         except Exception as e:
             print(f"Error in web news search: {e}")
+        
+        # Result pages are ranked by relevance, not time
+        articles.sort(key=lambda article: article['created_at'], reverse=True)
+        yield from articles
+
+def reddit_post_to_event(post: Dict, city: str, enriched: Optional[Tuple[float, str]] = None) -> Dict:
+    """Convert a Reddit post dict into a protest event with sentiment"""
+    # Sentiment and truncated text, unless precomputed by the enrichment pipeline
+    sentiment, text = enriched or enrich_text(post['title'], post['text'])
+    
+    return {
+        "id": f"reddit_{post['id']}",
+        "title": post['title'],
+        "text": text,
+        "author": post['author'],
+        "created_at": post['created_at'].isoformat(),
+        "city": city,
+        "source": "reddit",
+        "sentiment": sentiment,
+        "score": post['score'],
+        "comments_count": post['comments_count'],
+        "url": post['url'],
+        "subreddit": post['subreddit']
+    }
+
+def news_article_to_event(article: Dict, city: str, enriched: Optional[Tuple[float, str]] = None) -> Dict:
+    """Convert a news article dict into a protest event with sentiment"""
+    # Sentiment and truncated text, unless precomputed by the enrichment pipeline
+    sentiment, text = enriched or enrich_text(article['title'], article['text'])
+    
+    # IDs must be stable across searches so the event store can upsert them
+    url_hash = hashlib.sha1(article['url'].encode('utf-8')).hexdigest()[:16]
+    
+    return {
+        "id": f"news_{url_hash}",
+        "title": article['title'],
+        "text": text,
+        "author": article['author'],
+        "created_at": article['created_at'].isoformat(),
+        "city": city,
+        "source": "news",
+        "sentiment": sentiment,
+        "score": 0,  # News doesn't have scores like Reddit
+        "comments_count": article['comments_count'],
+        "url": article['url'],
+        "news_source": article.get('news_source', 'unknown')
+    }
+
+def parse_event_time(value) -> datetime:
+    """Parse an event timestamp into an aware UTC datetime (naive values are local time)"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.astimezone()
+    return value.astimezone(timezone.utc)
+
+class CityMatcher:
+    """Routes a post to every monitored city it mentions using one compiled pattern"""
+    
+    def __init__(self, cities: List[str]):
+        self.cities = list(dict.fromkeys(c.strip() for c in cities if c.strip()))
+        self._by_name = {city.lower(): city for city in self.cities}
+        self._by_subreddit = {
+            name: city for city in self.cities for name in city_subreddits(city)
+        }
+        
+        # Longest names first so "New York City" wins over "York"
+        names = sorted(self._by_name, key=len, reverse=True)
+        self._city_pattern = re.compile(
+            r"\b(" + "|".join(re.escape(name) for name in names) + r")\b", re.IGNORECASE
+        )
+        self._protest_pattern = re.compile(
+            r"\b(" + "|".join(re.escape(k) for k in PROTEST_KEYWORDS) + r")", re.IGNORECASE
+        )
+    
+    @property
+    def subreddits(self) -> List[str]:
+        """All subreddits that need to be watched for these cities"""
+        return MONITORED_SUBREDDITS + list(self._by_subreddit)
+    
+    def match(self, title: str, text: str, subreddit: str = "") -> List[str]:
+        """Return the cities a post belongs to (empty if not protest-related)"""
+        content = f"{title}\n{text}"
+        if not self._protest_pattern.search(content):
+            return []
+        
+        matched = {self._by_name[m.group(1).lower()] for m in self._city_pattern.finditer(content)}
+        
+        # Posts in a city's own subreddit belong to that city even without naming it
+        local_city = self._by_subreddit.get(subreddit.lower())
+        if local_city:
+            matched.add(local_city)
+        
+        return [city for city in self.cities if city in matched]
+
+class ProtestStreamIngestor:
+    """Real-time ingestion from Reddit submission streams with multi-city routing"""
+    
+    def __init__(self, reddit_api: RedditAPI, store_size: int = 500, seen_size: int = 10000):
+        self.reddit_api = reddit_api
+        self.store_size = store_size
+        self.seen_size = seen_size
+        self.city_stores: Dict[str, deque] = {}
+        self.listeners: List[Callable[[Dict], None]] = []
+        self.matcher: Optional[CityMatcher] = None
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def add_listener(self, listener: Callable[[Dict], None]):
+        """Register a callback invoked with every event delivered to a city"""
+        self.listeners.append(listener)
+    
+    def start(self, cities: List[str]) -> bool:
+        """Start (or restart) streaming for the given cities in a background thread"""
+        if not self.reddit_api.reddit:
+            return False
+        
+        matcher = CityMatcher(cities)
+        if not matcher.cities:
+            return False
+        
+        if self.running:
+            if self.matcher and set(self.matcher.cities) == set(matcher.cities):
+                return True
+            self.stop()
+        
+        with self._lock:
+            self.matcher = matcher
+            for city in matcher.cities:
+                self.city_stores.setdefault(city, deque(maxlen=self.store_size))
+        
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(matcher, self._stop_event), daemon=True)
+        self._thread.start()
+        return True
+    
+    def stop(self, timeout: float = 5.0):
+        """Stop the background stream"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+    
+    def recent_events(self, city: str, limit: int = 50) -> List[Dict]:
+        """Most recent streamed events for a city (newest first)"""
+        with self._lock:
+            store = self.city_stores.get(self._store_key(city))
+            return list(store)[:limit] if store else []
+    
+    def _store_key(self, city: str) -> str:
+        for name in self.city_stores:
+            if name.lower() == city.strip().lower():
+                return name
+        return city
+    
+    def _run(self, matcher: CityMatcher, stop_event: threading.Event):
+        for submission in self.reddit_api.stream_submissions(matcher.subreddits, stop_event):
+            try:
+                self.ingest(submission, matcher)
+            except Exception as e:
+                print(f"Error ingesting streamed submission: {e}")
+    
+    def ingest(self, submission, matcher: Optional[CityMatcher] = None) -> List[Dict]:
+        """Route one submission to every matching city's store"""
+        matcher = matcher or self.matcher
+        if matcher is None:
+            return []
+        
+        # Each post is processed once, even if the stream re-yields it
+        with self._lock:
+            if submission.id in self._seen:
+                return []
+            self._seen[submission.id] = True
+            if len(self._seen) > self.seen_size:
+                self._seen.popitem(last=False)
+        
+        subreddit_name = str(submission.subreddit.display_name)
+        cities = matcher.match(submission.title, submission.selftext, subreddit_name)
+        if not cities:
+            return []
+        
+        # Sentiment is computed once per post and shared by every city it is routed to
+        base_event = reddit_post_to_event(RedditAPI._submission_to_post(submission, subreddit_name), cities[0])
+        
+        delivered = []
+        for city in cities:
+            event = {**base_event, "city": city}
+            with self._lock:
+                self.city_stores.setdefault(city, deque(maxlen=self.store_size)).appendleft(event)
+            delivered.append(event)
+        
+        for event in delivered:
+            for listener in self.listeners:
+                try:
+                    listener(event)
+                except Exception as e:
+                    print(f"Error in stream listener: {e}")
+        
+        return delivered
+
+class CommentBudget:
+    """Thread-safe budget of API calls and comments"""
+    
+    def __init__(self, max_api_calls: int, max_comments: int):
+        self.max_api_calls = max_api_calls
+        self.max_comments = max_comments
+        self.api_calls = 0
+        self.comments = 0
+        self._lock = threading.Lock()
+    
+    def to_dict(self) -> Dict:
+        return {
+            "api_calls": self.api_calls,
+            "max_api_calls": self.max_api_calls,
+            "comments": self.comments,
+            "max_comments": self.max_comments
+        }
+    
+    @staticmethod
+    def spend(budgets: List['CommentBudget'], api_calls: int = 0, comments: int = 0) -> bool:
+        """Spend from every budget at once, or from none if any would be exceeded"""
+        # Fixed lock order (global budget first) keeps concurrent spenders deadlock-free
+        locks = [budget._lock for budget in budgets]
+        for lock in locks:
+            lock.acquire()
+        try:
+            if any(b.api_calls + api_calls > b.max_api_calls or b.comments + comments > b.max_comments
+                   for b in budgets):
+                return False
+            for budget in budgets:
+                budget.api_calls += api_calls
+                budget.comments += comments
+            return True
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+class CommentIngestor:
+    """Bounded, budgeted comment-tree ingestion for Reddit posts"""
+    
+    def __init__(self, reddit_api: RedditAPI, per_post_api_calls: int = 3, per_post_comments: int = 50,
+                 max_api_calls: int = 30, max_comments: int = 500, max_depth: int = 3,
+                 max_workers: int = 4, time_budget: float = 20.0):
+        self.reddit_api = reddit_api
+        self.per_post_api_calls = per_post_api_calls
+        self.per_post_comments = per_post_comments
+        self.max_api_calls = max_api_calls
+        self.max_comments = max_comments
+        self.max_depth = max_depth
+        self.max_workers = max_workers
+        self.time_budget = time_budget
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Long-lived workers keep their thread-local praw clients (and OAuth tokens) across
+        # calls; a fresh pool per call would log in again, outside the API-call budget
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="comment-ingestor")
+            return self._executor
+    
+    def fetch_comments(self, post_ids: List[str]) -> Dict:
+        """
+        Fetch the highest-scored comments for each post within the configured budgets.
+        
+        Returns a dict with the comments per post ID, whether each post was cut short,
+        and the budget that was used. Posts that could not be finished in time return
+        the comments collected so far.
+        """
+        global_budget = CommentBudget(self.max_api_calls, self.max_comments)
+        deadline = time.monotonic() + self.time_budget
+        stop_event = threading.Event()
+        comments: Dict[str, List[Dict]] = {post_id: [] for post_id in post_ids}
+        truncated: Dict[str, bool] = {post_id: True for post_id in post_ids}
+        
+        if self.reddit_api.reddit and post_ids:
+            executor = self._get_executor()
+            futures = {
+                executor.submit(self._fetch_post, post_id, comments[post_id], global_budget, deadline, stop_event): post_id
+                for post_id in post_ids
+            }
+            done, _ = wait(futures, timeout=max(deadline - time.monotonic(), 0))
+            
+            # Anything still running stops at its next API call; keep what it has so far
+            stop_event.set()
+            for future in futures:
+                future.cancel()
             
-        return articles
+            for future in done:
+                try:
+                    truncated[futures[future]] = future.result()
+                except Exception as e:
+                    print(f"Error fetching comments for {futures[future]}: {e}")
+        
+        return {
+            "comments": {post_id: list(post_comments) for post_id, post_comments in comments.items()},
+            "truncated": truncated,
+            "budget": global_budget.to_dict()
+        }
+    
+    def _fetch_post(self, post_id: str, collected: List[Dict], global_budget: CommentBudget,
+                    deadline: float, stop_event: threading.Event) -> bool:
+        """Collect comments best-score-first into `collected`; returns True if cut short"""
+        budgets = [global_budget, CommentBudget(self.per_post_api_calls, self.per_post_comments)]
+        
+        def out_of_time() -> bool:
+            return stop_event.is_set() or time.monotonic() >= deadline
+        
+        if out_of_time() or not CommentBudget.spend(budgets, api_calls=1):
+            return True
+        
+        submission = self.reddit_api.thread_client().submission(id=post_id)
+        submission.comment_sort = 'top'
+        submission.comment_limit = self.per_post_comments
+        
+        # Breadth-first frontier, highest score first within each depth. "Load more" stubs rank
+        # just below their lowest loaded sibling (their comments scored lower, or Reddit would
+        # have sent them) and are only expanded while the API-call budget allows
+        frontier = []
+        counter = itertools.count()
+        # /api/morechildren returns a flat list of descendants from every depth; deeper ones
+        # wait here, keyed by parent fullname, until their parent comment is collected
+        orphans: Dict[str, List] = {}
+        
+        def push(nodes, depth: int, parent_score: int):
+            nodes = list(nodes)
+            loaded_scores = [node.score for node in nodes if not isinstance(node, praw.models.MoreComments)]
+            stub_score = min(loaded_scores) - 1 if loaded_scores else parent_score
+            for node in nodes:
+                score = stub_score if isinstance(node, praw.models.MoreComments) else node.score
+                heapq.heappush(frontier, (depth, -score, next(counter), node))
+        
+        push(submission.comments, 0, submission.score)
+        cut_short = False
+        
+        while frontier:
+            depth, neg_score, _, node = heapq.heappop(frontier)
+            
+            if isinstance(node, praw.models.MoreComments):
+                if out_of_time() or any(b.comments >= b.max_comments for b in budgets):
+                    return True
+                if not CommentBudget.spend(budgets, api_calls=1):
+                    # Out of API calls: keep taking the comments that are already loaded
+                    cut_short = True
+                    continue
+                siblings = []
+                for child in node.comments():
+                    if child.parent_id == node.parent_id:
+                        siblings.append(child)
+                    else:
+                        orphans.setdefault(child.parent_id, []).append(child)
+                push(siblings, depth, -neg_score)
+                continue
+            
+            if not CommentBudget.spend(budgets, comments=1):
+                return True
+            
+            collected.append({
+                "id": node.id,
+                "parent_id": node.parent_id,
+                "author": str(node.author) if node.author else 'unknown',
+                "body": node.body[:500] + "..." if len(node.body) > 500 else node.body,
+                "score": node.score,
+                "depth": depth,
+                "created_at": datetime.fromtimestamp(node.created_utc, tz=timezone.utc).isoformat()
+            })
+            
+            if depth + 1 < self.max_depth:
+                push(list(node.replies) + orphans.pop(f"t1_{node.id}", []), depth + 1, node.score)
+        
+        return cut_short
+
+# Rollup granularities (name -> bucket width in seconds) and how many buckets to retain
+ROLLUP_GRANULARITIES = {"hour": 3600, "day": 86400}
+ROLLUP_RETENTION = {"hour": 24 * 90, "day": 365 * 2}
+
+@dataclass
+class RollupBucket:
+    """Aggregated volume and sentiment for one city over one time bucket"""
+    count: int = 0
+    sentiment_sum: float = 0.0
+    sentiment_sq_sum: float = 0.0
+    negative_count: int = 0
+    score_sum: int = 0
+    comments_sum: int = 0
+    sources: Dict[str, int] = field(default_factory=dict)
+    
+    def add(self, event: Dict):
+        sentiment = event.get('sentiment', 0.0)
+        self.count += 1
+        self.sentiment_sum += sentiment
+        self.sentiment_sq_sum += sentiment * sentiment
+        if sentiment < -0.1:
+            self.negative_count += 1
+        self.score_sum += event.get('score', 0) or 0
+        self.comments_sum += event.get('comments_count', 0) or 0
+        source = event.get('source', 'unknown')
+        self.sources[source] = self.sources.get(source, 0) + 1
+    
+    def to_dict(self, start: datetime) -> Dict:
+        mean = self.sentiment_sum / self.count if self.count else 0.0
+        variance = max(self.sentiment_sq_sum / self.count - mean * mean, 0.0) if self.count else 0.0
+        return {
+            "start": start.isoformat(),
+            "count": self.count,
+            "average_sentiment": round(mean, 3),
+            "sentiment_stddev": round(variance ** 0.5, 3),
+            "negative_share": round(self.negative_count / self.count, 3) if self.count else 0.0,
+            "total_score": self.score_sum,
+            "total_comments": self.comments_sum,
+            "sources": dict(self.sources)
+        }
+
+class ProtestRollups:
+    """Incrementally maintained hourly and daily rollups of protest events per city"""
+    
+    def __init__(self, seen_size: int = 100000):
+        self.seen_size = seen_size
+        # city -> granularity -> bucket start (epoch seconds) -> bucket
+        self._buckets: Dict[str, Dict[str, Dict[int, RollupBucket]]] = {}
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def add_event(self, event: Dict) -> bool:
+        """Add one event to every granularity; events already counted for the city are ignored"""
+        try:
+            timestamp = int(parse_event_time(event['created_at']).timestamp())
+        except (KeyError, TypeError, ValueError):
+            return False
+        
+        city_key = event.get('city', '').strip().lower()
+        # The same post can be routed to several cities; count it once per city
+        seen_key = (event['id'], city_key)
+        
+        with self._lock:
+            if seen_key in self._seen:
+                return False
+            self._seen[seen_key] = True
+            if len(self._seen) > self.seen_size:
+                self._seen.popitem(last=False)
+            
+            city_buckets = self._buckets.setdefault(city_key, {})
+            for granularity, width in ROLLUP_GRANULARITIES.items():
+                buckets = city_buckets.setdefault(granularity, {})
+                start = timestamp - timestamp % width
+                bucket = buckets.get(start)
+                if bucket is None:
+                    bucket = buckets[start] = RollupBucket()
+                    self._prune(buckets, start - width * ROLLUP_RETENTION[granularity])
+                bucket.add(event)
+        
+        return True
+    
+    def add_events(self, events: List[Dict]) -> int:
+        return sum(1 for event in events if self.add_event(event))
+    
+    def series(self, city: str, granularity: str = "hour", periods: int = 24,
+               end: Optional[datetime] = None) -> List[Dict]:
+        """Bucket series ending at `end` (default now), oldest first, with empty buckets filled in"""
+        if granularity not in ROLLUP_GRANULARITIES:
+            raise ValueError(f"Unknown granularity '{granularity}', expected one of {list(ROLLUP_GRANULARITIES)}")
+        
+        width = ROLLUP_GRANULARITIES[granularity]
+        end_ts = int(parse_event_time(end or datetime.now(timezone.utc)).timestamp())
+        last_start = end_ts - end_ts % width
+        
+        with self._lock:
+            buckets = self._buckets.get(city.strip().lower(), {}).get(granularity, {})
+            series = []
+            for i in range(periods - 1, -1, -1):
+                start = last_start - i * width
+                bucket = buckets.get(start) or RollupBucket()
+                series.append(bucket.to_dict(datetime.fromtimestamp(start, tz=timezone.utc)))
+        
+        return series
+    
+    @staticmethod
+    def _prune(buckets: Dict[int, RollupBucket], cutoff: int):
+        for start in [s for s in buckets if s < cutoff]:
+            del buckets[start]
+
+class EwmaStat:
+    """Exponentially weighted moving mean and variance, updated in O(1)"""
+    
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.mean = 0.0
+        self.variance = 0.0
+        self.count = 0
+    
+    @property
+    def stddev(self) -> float:
+        return self.variance ** 0.5
+    
+    def update(self, value: float):
+        if self.count == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            increment = self.alpha * diff
+            self.mean += increment
+            self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+        self.count += 1
+    
+    def z_score(self, value: float) -> float:
+        # Floor the deviation so a perfectly flat baseline does not alert on noise
+        return (value - self.mean) / max(self.stddev, 0.5 if self.mean >= 1 else 0.1)
+
+class CityEscalationState:
+    """Per-city detector state: post rate per interval and negative share"""
+    
+    def __init__(self):
+        self.interval_start: Optional[int] = None
+        self.interval_count = 0
+        self.rate = EwmaStat(alpha=0.1)
+        self.negative_fast = EwmaStat(alpha=0.1)
+        self.negative_slow = EwmaStat(alpha=0.02)
+        self.last_alert: Dict[str, int] = {}
+
+class EscalationDetector:
+    """Streaming spike and escalation detector over protest events"""
+    
+    def __init__(self, interval_seconds: int = 900, z_threshold: float = 3.0,
+                 warmup_intervals: int = 8, warmup_events: int = 20,
+                 cooldown_seconds: int = 1800, max_alerts: int = 1000):
+        self.interval_seconds = interval_seconds
+        self.z_threshold = z_threshold
+        self.warmup_intervals = warmup_intervals
+        self.warmup_events = warmup_events
+        self.cooldown_seconds = cooldown_seconds
+        self.alerts: deque = deque(maxlen=max_alerts)
+        self.listeners: List[Callable[[Dict], None]] = []
+        self._states: Dict[str, CityEscalationState] = {}
+        self._lock = threading.Lock()
+    
+    def add_listener(self, listener: Callable[[Dict], None]):
+        """Register a callback invoked with every new alert"""
+        self.listeners.append(listener)
+    
+    def add_event(self, event: Dict) -> List[Dict]:
+        """Update the city's state with one event and return any alerts it triggers"""
+        try:
+            timestamp = int(parse_event_time(event['created_at']).timestamp())
+        except (KeyError, TypeError, ValueError):
+            return []
+        
+        city = event.get('city', '')
+        with self._lock:
+            state = self._states.setdefault(city.strip().lower(), CityEscalationState())
+            candidates = [
+                self._update_rate(state, timestamp),
+                # No engagement metric: streamed posts arrive seconds old, before any votes
+                self._update_negative_share(state, event.get('sentiment', 0.0))
+            ]
+            
+            alerts = []
+            for candidate in candidates:
+                if candidate is None:
+                    continue
+                metric = candidate['metric']
+                if timestamp - state.last_alert.get(metric, -self.cooldown_seconds) < self.cooldown_seconds:
+                    continue
+                state.last_alert[metric] = timestamp
+                candidate.update({
+                    "city": city,
+                    "event_id": event.get('id'),
+                    "detected_at": datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat(),
+                    "severity": "critical" if candidate['z_score'] >= 2 * self.z_threshold else "warning"
+                })
+                self.alerts.append(candidate)
+                alerts.append(candidate)
+        
+        for alert in alerts:
+            for listener in self.listeners:
+                try:
+                    listener(alert)
+                except Exception as e:
+                    print(f"Error in alert listener: {e}")
+        
+        return alerts
+    
+    def recent_alerts(self, city: str = "", since: Optional[datetime] = None) -> List[Dict]:
+        """Alerts for a city (or all cities), newest first"""
+        city_key = city.strip().lower()
+        with self._lock:
+            alerts = list(self.alerts)
+        
+        return [
+            alert for alert in reversed(alerts)
+            if (not city_key or alert['city'].strip().lower() == city_key)
+            and (since is None or parse_event_time(alert['detected_at']) >= parse_event_time(since))
+        ]
+    
+    def _update_rate(self, state: CityEscalationState, timestamp: int) -> Optional[Dict]:
+        interval_start = timestamp - timestamp % self.interval_seconds
+        
+        if state.interval_start is None:
+            state.interval_start = interval_start
+        elif interval_start > state.interval_start:
+            # Close the current interval, then any empty ones in between (capped to one day)
+            state.rate.update(state.interval_count)
+            skipped = (interval_start - state.interval_start) // self.interval_seconds - 1
+            for _ in range(min(skipped, 86400 // self.interval_seconds)):
+                state.rate.update(0)
+            state.interval_start = interval_start
+            state.interval_count = 0
+        elif interval_start < state.interval_start:
+            # Late events do not change the rate of an interval that is already closed
+            return None
+        
+        state.interval_count += 1
+        
+        if state.rate.count < self.warmup_intervals or state.interval_count < 3:
+            return None
+        
+        z_score = state.rate.z_score(state.interval_count)
+        if z_score < self.z_threshold:
+            return None
+        
+        return {
+            "metric": "post_rate",
+            "message": f"Post volume spike: {state.interval_count} posts this interval vs baseline {state.rate.mean:.1f}",
+            "value": state.interval_count,
+            "baseline": round(state.rate.mean, 3),
+            "z_score": round(z_score, 2)
+        }
+    
+    def _update_negative_share(self, state: CityEscalationState, sentiment: float) -> Optional[Dict]:
+        is_negative = 1.0 if sentiment < -0.1 else 0.0
+        state.negative_fast.update(is_negative)
+        state.negative_slow.update(is_negative)
+        
+        if state.negative_slow.count < self.warmup_events:
+            return None
+        
+        shift = state.negative_fast.mean - state.negative_slow.mean
+        if state.negative_fast.mean < 0.5 or shift < 0.25:
+            return None
+        
+        return {
+            "metric": "negative_share",
+            "message": f"Negative sentiment rising: {state.negative_fast.mean:.0%} of recent posts vs baseline {state.negative_slow.mean:.0%}",
+            "value": round(state.negative_fast.mean, 3),
+            "baseline": round(state.negative_slow.mean, 3),
+            # Express the shift in the same units as the post-rate threshold
+            "z_score": round(shift / 0.25 * self.z_threshold, 2)
+        }
+
+EVENT_COLUMNS = [
+    "id", "city", "source", "title", "text", "author", "created_at", "sentiment",
+    "score", "comments_count", "url", "subreddit", "news_source"
+]
+
+class ProtestEventStore:
+    """Persistent SQLite store of collected events with FTS5 full-text search"""
+    
+    def __init__(self, path: Optional[str] = None, batch_size: int = 500):
+        self.path = path or os.getenv('PROTEST_DB_PATH', 'protest_events.db')
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._fts_enabled = False
+    
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Opened on first use: importing this module (as pool workers do) never touches the database
+        if self._connection is None:
+            with self._connect_lock:
+                if self._connection is None:
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    conn.row_factory = sqlite3.Row
+                    self._fts_enabled = self._create_schema(conn)
+                    self._connection = conn
+        return self._connection
+    
+    @property
+    def fts_enabled(self) -> bool:
+        return self._conn is not None and self._fts_enabled
+    
+    def _create_schema(self, conn: sqlite3.Connection) -> bool:
+        # Not yet shared with other threads, so no need for self._lock
+        with conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS events (
+                    -- Explicit rowid alias: the FTS index links by rowid, which VACUUM may
+                    -- renumber unless it is declared as the INTEGER PRIMARY KEY
+                    rowid INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL,
+                    city TEXT NOT NULL,
+                    city_key TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    title TEXT,
+                    text TEXT,
+                    author TEXT,
+                    created_at TEXT,
+                    created_ts REAL,
+                    sentiment REAL,
+                    score INTEGER,
+                    comments_count INTEGER,
+                    url TEXT,
+                    subreddit TEXT,
+                    news_source TEXT,
+                    UNIQUE (id, city_key)
+                );
+                CREATE INDEX IF NOT EXISTS idx_events_city_time ON events (city_key, created_ts DESC);
+                CREATE INDEX IF NOT EXISTS idx_events_time ON events (created_ts DESC);
+            """)
+            
+            try:
+                # External-content index: the text lives once, in `events`
+                conn.executescript("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+                        title, text, content='events', content_rowid='rowid'
+                    );
+                    CREATE TRIGGER IF NOT EXISTS events_ai AFTER INSERT ON events BEGIN
+                        INSERT INTO events_fts (rowid, title, text) VALUES (new.rowid, new.title, new.text);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS events_ad AFTER DELETE ON events BEGIN
+                        INSERT INTO events_fts (events_fts, rowid, title, text) VALUES ('delete', old.rowid, old.title, old.text);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS events_au AFTER UPDATE OF title, text ON events BEGIN
+                        INSERT INTO events_fts (events_fts, rowid, title, text) VALUES ('delete', old.rowid, old.title, old.text);
+                        INSERT INTO events_fts (rowid, title, text) VALUES (new.rowid, new.title, new.text);
+                    END;
+                """)
+                return True
+            except sqlite3.OperationalError as e:
+                print(f"⚠️  SQLite FTS5 not available ({e}). Keyword search will use LIKE.")
+                return False
+    
+    def upsert_events(self, events: List[Dict]) -> int:
+        """Insert or update events by (id, city) in batched transactions"""
+        rows = []
+        for event in events:
+            try:
+                created_ts = parse_event_time(event['created_at']).timestamp()
+            except (KeyError, TypeError, ValueError):
+                created_ts = None
+            rows.append(
+                [event.get(column) for column in EVENT_COLUMNS]
+                + [event.get('city', '').strip().lower(), created_ts]
+            )
+        
+        placeholders = ", ".join("?" for _ in range(len(EVENT_COLUMNS) + 2))
+        updates = ", ".join(f"{column} = excluded.{column}" for column in EVENT_COLUMNS if column not in ("id", "city"))
+        sql = (
+            f"INSERT INTO events ({', '.join(EVENT_COLUMNS)}, city_key, created_ts) VALUES ({placeholders}) "
+            f"ON CONFLICT (id, city_key) DO UPDATE SET {updates}, created_ts = excluded.created_ts"
+        )
+        
+        with self._lock:
+            for i in range(0, len(rows), self.batch_size):
+                with self._conn:
+                    self._conn.executemany(sql, rows[i:i + self.batch_size])
+        
+        return len(rows)
+    
+    def upsert_event(self, event: Dict):
+        self.upsert_events([event])
+    
+    def recent_events(self, city: str, limit: int = 100, since: Optional[datetime] = None) -> List[Dict]:
+        """Most recent stored events for a city (newest first)"""
+        sql = "SELECT * FROM events WHERE city_key = ?"
+        params: List[Any] = [city.strip().lower()]
+        if since is not None:
+            sql += " AND created_ts >= ?"
+            params.append(parse_event_time(since).timestamp())
+        sql += " ORDER BY created_ts DESC LIMIT ?"
+        params.append(limit)
+        
+        return self._query(sql, params)
+    
+    def search(self, keywords: List[str], city: str = "", limit: int = 100) -> List[Dict]:
+        """Events whose title or text matches any keyword (newest first)"""
+        keywords = [k for k in keywords if k]
+        if not keywords:
+            return []
+        
+        if self.fts_enabled:
+            # Quote each keyword so user input is matched as a phrase, not FTS syntax, and
+            # prefix-match it so "arrest" also finds "arrested" like the in-memory filter
+            match = " OR ".join('"' + k.replace('"', '""') + '"*' for k in keywords)
+            sql = "SELECT events.* FROM events_fts JOIN events ON events.rowid = events_fts.rowid WHERE events_fts MATCH ?"
+            params: List[Any] = [match]
+        else:
+            sql = "SELECT * FROM events WHERE (" + " OR ".join("title LIKE ? OR text LIKE ?" for _ in keywords) + ")"
+            params = [f"%{k}%" for k in keywords for _ in range(2)]
+        
+        if city:
+            sql += " AND events.city_key = ?" if self.fts_enabled else " AND city_key = ?"
+            params.append(city.strip().lower())
+        sql += " ORDER BY created_ts DESC LIMIT ?"
+        params.append(limit)
+        
+        return self._query(sql, params)
+    
+    def recent_documents(self, limit: int = 20000) -> List[Tuple[str, str]]:
+        """(id, title + text) of the most recently stored events, one row per event ID"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, MAX(title || ' ' || COALESCE(text, '')) FROM events "
+                "GROUP BY id ORDER BY MAX(created_ts) DESC LIMIT ?", [limit]
+            ).fetchall()
+        return [(row[0], row[1]) for row in rows]
+    
+    def _query(self, sql: str, params: List[Any]) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        
+        events = []
+        for row in rows:
+            event = {column: row[column] for column in EVENT_COLUMNS}
+            if event['source'] == 'reddit':
+                event.pop('news_source')
+            else:
+                event.pop('subreddit')
+            events.append(event)
+        return events
+
+def event_document(event: Dict) -> str:
+    """Text used for theme extraction: title and body"""
+    return f"{event.get('title', '')} {event.get('text', '')}"
+
+class ThemeEngine:
+    """Corpus-aware theme extraction with incrementally maintained document frequencies"""
+    
+    def __init__(self, max_terms: int = 200000, seen_size: int = 200000,
+                 store: Optional['ProtestEventStore'] = None, seed_limit: int = 20000):
+        self.max_terms = max_terms
+        self.seen_size = seen_size
+        self.doc_count = 0
+        self.doc_freq: Counter = Counter()
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        # Seeded on first use rather than at import, which would read the database in every importer
+        self._store = store
+        self.seed_limit = seed_limit
+        self._seed_lock = threading.Lock()
+    
+    def _ensure_seeded(self):
+        if self._store is None:
+            return
+        with self._seed_lock:
+            store, self._store = self._store, None
+            if store is not None:
+                self.seed_from_store(store, self.seed_limit)
+    
+    def add_document(self, doc_id: str, terms: List[str]) -> bool:
+        """Count a document's distinct terms once; already seen IDs are ignored"""
+        with self._lock:
+            if doc_id in self._seen:
+                return False
+            self._seen[doc_id] = True
+            if len(self._seen) > self.seen_size:
+                self._seen.popitem(last=False)
+            
+            self.doc_count += 1
+            self.doc_freq.update(set(terms))
+            if len(self.doc_freq) > self.max_terms:
+                self._prune()
+        
+        return True
+    
+    def add_event(self, event: Dict) -> bool:
+        return self.add_document(event['id'], theme_terms(event_document(event)))
+    
+    def add_events(self, events: List[Dict], terms: Optional[List[List[str]]] = None):
+        """Add a batch of events, tokenizing only the new ones unless terms are given"""
+        self._ensure_seeded()
+        if terms is not None:
+            for event, event_terms in zip(events, terms):
+                self.add_document(event['id'], event_terms)
+            return
+        
+        with self._lock:
+            events = [event for event in events if event['id'] not in self._seen]
+        for event in events:
+            self.add_document(event['id'], theme_terms(event_document(event)))
+    
+    def seed_from_store(self, store: 'ProtestEventStore', limit: int = 20000):
+        """Build the background statistics from events persisted by earlier runs"""
+        documents = store.recent_documents(limit)
+        for doc_id, text in documents:
+            self.add_document(doc_id, theme_terms(text))
+    
+    def idf(self, term: str) -> float:
+        # Smoothed IDF: unseen terms score highest, terms in every document score 1
+        return math.log((1 + self.doc_count) / (1 + self.doc_freq.get(term, 0))) + 1
+    
+    def top_themes(self, term_lists: List[List[str]], limit: int = 10,
+                   exclude_words: Optional[set] = None) -> List[Tuple[str, int, float]]:
+        """(term, mentions, score) for the most distinctive terms in a set of documents"""
+        self._ensure_seeded()
+        mentions = Counter()
+        for terms in term_lists:
+            mentions.update(terms)
+        
+        # Ignore one-off terms once there are enough documents to find shared themes
+        min_mentions = 2 if len(term_lists) >= 10 else 1
+        city_words = set(exclude_words or ())
+        subsumed = set()
+        
+        # A word that only ever appears inside one phrase is reported as the phrase
+        for term, count in mentions.items():
+            if ' ' in term:
+                subsumed.update(word for word in term.split() if mentions[word] == count)
+        
+        with self._lock:
+            scored = [
+                (term, count, (1 + math.log(count)) * self.idf(term))
+                for term, count in mentions.items()
+                if count >= min_mentions and term not in subsumed
+                and not city_words.intersection(term.split())
+            ]
+        
+        scored.sort(key=lambda item: (item[2], item[1]), reverse=True)
+        return [(term, count, round(score, 3)) for term, count, score in scored[:limit]]
+    
+    def _prune(self):
+        # Shrink to a low-water mark so pruning runs once per ~10% of the cap, not on every add.
+        # Rarest terms go first; the sort is stable, so ties drop the oldest and new terms survive.
+        low_water = int(self.max_terms * 0.9)
+        by_freq = sorted(self.doc_freq.items(), key=lambda item: item[1])
+        for term, _ in by_freq[:len(by_freq) - low_water]:
+            del self.doc_freq[term]
 
 # Initialize APIs
 reddit_api = RedditAPI()
 news_api = NewsAPI()
+stream_ingestor = ProtestStreamIngestor(reddit_api)
+comment_ingestor = CommentIngestor(reddit_api)
+protest_rollups = ProtestRollups()
+escalation_detector = EscalationDetector()
+event_store = ProtestEventStore()
+enrichment_pipeline = EnrichmentPipeline()
+theme_engine = ThemeEngine(store=event_store)
+stream_ingestor.add_listener(protest_rollups.add_event)
+stream_ingestor.add_listener(escalation_detector.add_event)
+stream_ingestor.add_listener(event_store.upsert_event)
+stream_ingestor.add_listener(theme_engine.add_event)
 
 @tool
-def search_protest_posts(city: str, max_results: int = 100) -> str:
+def search_protest_posts(city: str, max_results: int = 100, from_store: bool = False,
+                         include_comments: bool = False) -> str:
     """
     Search Reddit and news sources for protest-related content in a specific city.
     
     Args:
         city: The city name to search for protests (e.g., "New York", "Los Angeles")
         max_results: Maximum number of posts to retrieve (default: 100)
+        from_store: Answer from the local event store instead of searching online,
+            including events older than the 30-day search window (default: False)
+        include_comments: Also fetch the top comments of Reddit posts, within fixed
+            API-call, comment and time budgets (default: False)
     
     Returns:
         JSON string containing formatted protest event data
     """
     try:
-        all_events = []
-        
-        # Search Reddit (50% of results)
-        reddit_limit = max_results // 2
-        print(f"🔍 Searching Reddit for protests in {city}...")
-        reddit_posts = reddit_api.search_protests(city, reddit_limit)
-        
-        for post in reddit_posts:
-            # Extract sentiment
-            text_content = f"{post['title']} {post['text']}"
-            blob = TextBlob(text_content)
-            sentiment = blob.sentiment.polarity
-            
-            event = {
-                "id": f"reddit_{post['id']}",
-                "title": post['title'],
-                "text": post['text'][:500] + "..." if len(post['text']) > 500 else post['text'],
-                "author": post['author'],
-                "created_at": post['created_at'].isoformat(),
-                "city": city,
-                "source": "reddit",
-                "sentiment": round(sentiment, 3),
-                "score": post['score'],
-                "comments_count": post['comments_count'],
-                "url": post['url'],
-                "subreddit": post['subreddit']
-            }
-            all_events.append(event)
-        
-        # Search News (50% of results)
-        news_limit = max_results // 2
-        print(f"📰 Searching news sources for protests in {city}...")
-        news_articles = news_api.search_protests(city, news_limit)
-        
-        for article in news_articles:
-            # Extract sentiment
-            text_content = f"{article['title']} {article['text']}"
-            blob = TextBlob(text_content)
-            sentiment = blob.sentiment.polarity
+        if from_store:
+            all_events = event_store.recent_events(city, max_results)
             
-            event = {
-                "id": f"news_{len(all_events)}",
-                "title": article['title'],
-                "text": article['text'][:500] + "..." if len(article['text']) > 500 else article['text'],
-                "author": article['author'],
-                "created_at": article['created_at'].isoformat(),
+            return json.dumps({
+                "status": "success" if all_events else "no_results",
                 "city": city,
-                "source": "news",
-                "sentiment": round(sentiment, 3),
-                "score": 0,  # News doesn't have scores like Reddit
-                "comments_count": article['comments_count'],
-                "url": article['url'],
-                "news_source": article.get('news_source', 'unknown')
-            }
-            all_events.append(event)
+                "from_store": True,
+                "total_events": len(all_events),
+                "reddit_events": len([e for e in all_events if e['source'] == 'reddit']),
+                "news_events": len([e for e in all_events if e['source'] == 'news']),
+                "search_timestamp": datetime.now().isoformat(),
+                "events": all_events
+            }, indent=2)
+        
+        # Every collector yields newest first; the heap merge keeps the global newest
+        # max_results and stops pulling (and fetching pages) from all sources once it has them
+        print(f"🔍 Searching Reddit and news sources for protests in {city}...")
+        merged = merge_by_recency(reddit_api.iter_protests(city), news_api.iter_protests(city))
+        items = list(itertools.islice(merged, max_results))
+        
+        # Sentiment and text normalization run on the process pool for large batches
+        enriched = enrichment_pipeline.enrich([(item['title'], item['text']) for item in items])
+        
+        all_events = [
+            reddit_post_to_event(item, city, result) if item['source'] == 'reddit'
+            else news_article_to_event(item, city, result)
+            for item, result in zip(items, enriched)
+        ]
         
         if not all_events:
             return json.dumps({
@@ -317,8 +1436,26 @@ def search_protest_posts(city: str, max_results: int = 100) -> str:
                 "events": []
             })
         
-        # Sort by creation date (most recent first)
-        all_events.sort(key=lambda x: x['created_at'], reverse=True)
+        # Persist events and keep the per-city rollups and theme statistics up to date
+        event_store.upsert_events(all_events)
+        protest_rollups.add_events(all_events)
+        theme_engine.add_events(all_events)
+        
+        events = all_events
+        comment_budget = None
+        
+        if include_comments:
+            # Only the posts actually returned are expanded
+            reddit_ids = [e['id'][len('reddit_'):] for e in events if e['source'] == 'reddit']
+            print(f"💬 Fetching comments for {len(reddit_ids)} Reddit posts...")
+            fetched = comment_ingestor.fetch_comments(reddit_ids)
+            comment_budget = fetched['budget']
+            
+            for event in events:
+                if event['source'] == 'reddit':
+                    post_id = event['id'][len('reddit_'):]
+                    event['comments'] = fetched['comments'].get(post_id, [])
+                    event['comments_truncated'] = fetched['truncated'].get(post_id, True)
         
         result = {
             "status": "success",
@@ -327,9 +1464,12 @@ def search_protest_posts(city: str, max_results: int = 100) -> str:
             "reddit_events": len([e for e in all_events if e['source'] == 'reddit']),
             "news_events": len([e for e in all_events if e['source'] == 'news']),
             "search_timestamp": datetime.now().isoformat(),
-            "events": all_events[:max_results]
+            "events": events
         }
         
+        if comment_budget:
+            result["comment_budget"] = comment_budget
+        
         return json.dumps(result, indent=2)
         
     except Exception as e:
@@ -374,14 +1514,11 @@ def analyze_protest_sentiment(events_data: str) -> str:
         total_reddit_score = sum(event.get('score', 0) for event in reddit_events)
         total_comments = sum(event.get('comments_count', 0) for event in events)
         
-        # Extract common themes from titles
-        all_titles = [event.get('title', '') for event in events]
-        common_words = []
-        for title in all_titles:
-            words = re.findall(r'\b\w+\b', title.lower())
-            common_words.extend([w for w in words if len(w) > 4 and w not in ['protest', 'demonstr', 'march']])
-        
-        word_freq = pd.Series(common_words).value_counts().head(10) if common_words else pd.Series()
+        # Extract distinctive themes (unigrams and bigrams scored by TF-IDF against all ingested events)
+        event_terms = [theme_terms(event_document(event)) for event in events]
+        theme_engine.add_events(events, event_terms)
+        city_words = {word for event in events for word in event.get('city', '').lower().split()}
+        themes = theme_engine.top_themes(event_terms, limit=10, exclude_words=city_words)
         
         # News sources breakdown
         news_sources = [event.get('news_source', 'unknown') for event in news_events]
@@ -409,7 +1546,8 @@ def analyze_protest_sentiment(events_data: str) -> str:
                     "avg_comments_per_post": round(total_comments / len(events), 1) if events else 0
                 }
             },
-            "top_themes": word_freq.to_dict() if not word_freq.empty else {},
+            "top_themes": {term: count for term, count, _ in themes},
+            "theme_scores": {term: score for term, _, score in themes},
             "top_news_sources": source_freq.to_dict() if not source_freq.empty else {},
             "top_subreddits": subreddit_freq.to_dict() if not subreddit_freq.empty else {},
             "insights": []
@@ -438,26 +1576,43 @@ def analyze_protest_sentiment(events_data: str) -> str:
         return f"Error analyzing sentiment: {str(e)}"
 
 @tool
-def filter_by_keywords(events_data: str, keywords: str) -> str:
+def filter_by_keywords(events_data: str, keywords: str, city: str = "",
+                       from_store: bool = False, max_results: int = 100) -> str:
     """
     Filter protest events by specific keywords or themes.
     
     Args:
-        events_data: JSON string containing protest events data
+        events_data: JSON string containing protest events data (ignored when from_store is set)
         keywords: Comma-separated keywords to filter by (e.g., "police,arrest,violence")
+        city: Restrict a store search to this city (default: all cities)
+        from_store: Full-text search all stored events instead of events_data (default: False)
+        max_results: Maximum number of events returned by a store search (default: 100)
     
     Returns:
         Filtered events data matching the keywords
     """
     try:
+        keyword_list = [k.strip().lower() for k in keywords.split(',')]
+        
+        if from_store:
+            filtered_events = event_store.search(keyword_list, city, max_results)
+            
+            return json.dumps({
+                "status": "success" if filtered_events else "no_results",
+                "city": city or "all",
+                "from_store": True,
+                "filtered_by": keyword_list,
+                "filtered_count": len(filtered_events),
+                "events": filtered_events
+            }, indent=2)
+        
         data = json.loads(events_data)
         events = data.get('events', [])
         
-        keyword_list = [k.strip().lower() for k in keywords.split(',')]
-        
         filtered_events = []
         for event in events:
-            text_lower = event['text'].lower()
+            # Title and text, the same fields the store's full-text index covers
+            text_lower = f"{event.get('title', '')} {event['text']}".lower()
             if any(keyword in text_lower for keyword in keyword_list):
                 filtered_events.append(event)
         
@@ -559,6 +1714,112 @@ PROTEST ACTIVITY SUMMARY FOR {city.upper()}
     except Exception as e:
         return f"Error generating summary: {str(e)}"
 
+@tool
+def start_protest_stream(cities: str) -> str:
+    """
+    Start real-time monitoring of new Reddit posts for one or more cities.
+    
+    Args:
+        cities: Comma-separated city names to monitor (e.g., "New York,Seattle")
+    
+    Returns:
+        JSON string describing the stream status
+    """
+    city_list = [c.strip() for c in cities.split(',') if c.strip()]
+    
+    if not stream_ingestor.start(city_list):
+        return json.dumps({
+            "status": "error",
+            "message": "Streaming requires Reddit credentials and at least one city",
+            "cities": city_list
+        })
+    
+    return json.dumps({
+        "status": "streaming",
+        "cities": stream_ingestor.matcher.cities,
+        "subreddits": stream_ingestor.matcher.subreddits
+    }, indent=2)
+
+@tool
+def get_live_protest_posts(city: str, max_results: int = 50) -> str:
+    """
+    Get the newest protest-related Reddit posts collected by the real-time stream.
+    
+    Args:
+        city: The city name (must be included in start_protest_stream)
+        max_results: Maximum number of posts to return (default: 50)
+    
+    Returns:
+        JSON string containing formatted protest event data
+    """
+    events = stream_ingestor.recent_events(city, max_results)
+    
+    return json.dumps({
+        "status": "success" if events else "no_results",
+        "city": city,
+        "streaming": stream_ingestor.running,
+        "total_events": len(events),
+        "reddit_events": len(events),
+        "news_events": 0,
+        "search_timestamp": datetime.now().isoformat(),
+        "events": events
+    }, indent=2)
+
+@tool
+def get_protest_trends(city: str, granularity: str = "hour", periods: int = 24) -> str:
+    """
+    Get time-bucketed volume and sentiment trends for a city from the precomputed rollups.
+    
+    Args:
+        city: The city name to get trends for
+        granularity: Bucket size, either "hour" or "day" (default: "hour")
+        periods: Number of buckets to return, ending with the current one (default: 24)
+    
+    Returns:
+        JSON string containing one entry per bucket, oldest first
+    """
+    try:
+        series = protest_rollups.series(city, granularity, periods)
+        
+        return json.dumps({
+            "status": "success",
+            "city": city,
+            "granularity": granularity,
+            "total_events": sum(bucket['count'] for bucket in series),
+            "buckets": series
+        }, indent=2)
+        
+    except Exception as e:
+        return json.dumps({
+            "status": "error",
+            "message": f"Error getting trends for {city}: {str(e)}",
+            "city": city,
+            "buckets": []
+        })
+
+@tool
+def get_escalation_alerts(city: str = "", since_minutes: int = 60) -> str:
+    """
+    Get spike and escalation alerts raised by the real-time stream detector.
+    
+    Args:
+        city: The city name to get alerts for (default: all monitored cities)
+        since_minutes: Only return alerts detected within this many minutes (default: 60)
+    
+    Returns:
+        JSON string containing alerts, newest first
+    """
+    since = datetime.now(timezone.utc) - timedelta(minutes=since_minutes)
+    alerts = escalation_detector.recent_alerts(city, since)
+    
+    return json.dumps({
+        "status": "success" if alerts else "no_alerts",
+        "city": city or "all",
+        "streaming": stream_ingestor.running,
+        "total_alerts": len(alerts),
+        "alerts": alerts
+    }, indent=2)
+
 def create_protest_monitor_agent():
     """Create and configure the protest monitoring agent"""
     
@@ -594,10 +1855,14 @@ Data Sources:
 Always be objective and factual in your analysis. Focus on providing actionable intelligence while respecting privacy and avoiding speculation. Clearly distinguish between social media discussion and professional news reporting.
 
 Available tools:
-- search_protest_posts: Search Reddit and news sources for protest-related content
+- search_protest_posts: Search Reddit and news sources for protest-related content (from_store=True answers from the local history)
 - analyze_protest_sentiment: Analyze sentiment and themes from protest data
-- filter_by_keywords: Filter events by specific keywords
+- filter_by_keywords: Filter events by specific keywords (from_store=True runs a full-text search over all stored events)
 - get_recent_protests_summary: Get comprehensive summary of protest activity
+- start_protest_stream: Start real-time monitoring of new Reddit posts for cities
+- get_live_protest_posts: Get the newest posts collected by the real-time stream
+- get_protest_trends: Get hourly or daily volume and sentiment trends for a city
+- get_escalation_alerts: Get spike and escalation alerts from the real-time stream
 
 Use these tools strategically to provide thorough and insightful analysis combining both grassroots social media perspective and professional news coverage.
 """
@@ -609,7 +1874,11 @@ Use these tools strategically to provide thorough and insightful analysis combin
             search_protest_posts,
             analyze_protest_sentiment,
             filter_by_keywords,
-            get_recent_protests_summary
+            get_recent_protests_summary,
+            start_protest_stream,
+            get_live_protest_posts,
+            get_protest_trends,
+            get_escalation_alerts
         ],
         provider=llm_provider
     )
@@ -0,0 +1,346 @@
+"""
+Offline tests for the Protest Monitor Agent's data pipeline
+Covers routing, rollups and other pure logic without network access or API keys
+"""
+
+import os
+import types
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Keep the event store in memory and enrichment in-process before the agent module loads
+os.environ['PROTEST_DB_PATH'] = ':memory:'
+os.environ['ENRICH_WORKERS'] = '1'
+
+for module in ('praw', 'textblob', 'bs4', 'newsapi', 'geopy', 'dotenv', 'strands_agents_sdk'):
+    pytest.importorskip(module)
+
+import enrichment
+import protest_monitor_agent as agent
+
+def make_submission(post_id, title, text="", subreddit="news", created_utc=1700000000):
+    """Minimal stand-in for a praw submission"""
+    return types.SimpleNamespace(
+        id=post_id, title=title, selftext=text, author="tester", created_utc=created_utc,
+        score=10, num_comments=2, permalink=f"/r/{subreddit}/comments/{post_id}",
+        subreddit=types.SimpleNamespace(display_name=subreddit)
+    )
+
+def make_event(event_id, city, created_at, sentiment=0.0, source="reddit"):
+    return {
+        "id": event_id, "city": city, "created_at": created_at.isoformat(), "sentiment": sentiment,
+        "score": 1, "comments_count": 1, "source": source, "title": "", "text": ""
+    }
+
+def test_city_matcher_routes_to_every_mentioned_city():
+    matcher = agent.CityMatcher(["New York", "York", "Seattle"])
+
+    assert matcher.match("Huge protest in New York and Seattle", "") == ["New York", "Seattle"]
+    assert matcher.match("Rally at the park", "", subreddit="Seattle") == ["Seattle"]
+    assert matcher.match("New York weather update", "") == []
+
+def test_streamed_multi_city_post_counts_in_each_city_rollup():
+    rollups = agent.ProtestRollups()
+    ingestor = agent.ProtestStreamIngestor(agent.reddit_api)
+    ingestor.add_listener(rollups.add_event)
+    matcher = agent.CityMatcher(["Seattle", "Portland"])
+
+    submission = make_submission("abc", "Protest planned in Seattle and Portland",
+                                 created_utc=datetime.now(timezone.utc).timestamp())
+    delivered = ingestor.ingest(submission, matcher)
+
+    assert [event['city'] for event in delivered] == ["Seattle", "Portland"]
+    assert rollups.series("Seattle", "hour", 1)[0]['count'] == 1
+    assert rollups.series("Portland", "hour", 1)[0]['count'] == 1
+
+    # A later search for either city finding the same post must not count it twice
+    assert not rollups.add_event(delivered[1])
+    assert rollups.series("Portland", "hour", 1)[0]['count'] == 1
+
+def test_rollup_series_fills_empty_buckets_and_aggregates_sentiment():
+    rollups = agent.ProtestRollups()
+    end = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    rollups.add_events([
+        make_event("a", "Seattle", end, sentiment=-0.5),
+        make_event("b", "Seattle", end, sentiment=0.5, source="news"),
+        make_event("c", "Seattle", end - timedelta(hours=2), sentiment=0.2)
+    ])
+
+    series = rollups.series("seattle", "hour", 3, end=end)
+
+    assert [bucket['count'] for bucket in series] == [1, 0, 2]
+    assert series[2]['average_sentiment'] == 0.0
+    assert series[2]['sentiment_stddev'] == 0.5
+    assert series[2]['sources'] == {"reddit": 1, "news": 1}
+
+@pytest.mark.parametrize("text, expected", [
+    ("30 seconds ago", timedelta(seconds=30)),
+    ("1 minute ago", timedelta(minutes=1)),
+    ("5 minutes ago", timedelta(minutes=5)),
+    ("12 mins ago", timedelta(minutes=12)),
+    ("3 hours ago", timedelta(hours=3)),
+    ("2 days ago", timedelta(days=2))
+])
+def test_parse_published_time_relative(text, expected):
+    now = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    assert agent.parse_published_time(f"Snippet text · {text}", now) == now - expected
+
+def test_parse_web_news_results_extracts_article_urls_and_times():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'google_news_seattle.html')
+    with open(path, 'rb') as f:
+        html = f.read()
+    now = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+    for parser in ('html.parser', agent.WEB_NEWS_PARSER):
+        results = agent.parse_web_news_results(html, limit=3, now=now, parser=parser)
+
+        assert len(results) == 3
+        assert results[0]['url'].startswith("https://news.example.com/seattle/")
+        assert results[0]['created_at'] == now - timedelta(minutes=12)
+        assert results[1]['created_at'] == now - timedelta(hours=1)
+
+def test_store_search_matches_like_in_memory_filter():
+    store = agent.ProtestEventStore(path=':memory:')
+    now = datetime.now(timezone.utc)
+    events = [
+        {**make_event("reddit_1", "Seattle", now), "title": "Dozens arrested downtown", "text": "", "url": "u1", "subreddit": "seattle"},
+        {**make_event("reddit_2", "Seattle", now - timedelta(hours=1)), "title": "Quiet march", "text": "No arrests made", "url": "u2", "subreddit": "seattle"},
+        {**make_event("reddit_3", "Portland", now), "title": "Arrest at rally", "text": "", "url": "u3", "subreddit": "portland"}
+    ]
+    store.upsert_events(events)
+
+    stored_ids = [event['id'] for event in store.search(["arrest"], city="Seattle")]
+    in_memory = agent.json.loads(agent.filter_by_keywords(agent.json.dumps({"events": events[:2]}), "arrest"))
+
+    assert stored_ids == ["reddit_1", "reddit_2"]
+    assert [event['id'] for event in in_memory['events']] == stored_ids
+
+def test_store_upsert_updates_instead_of_duplicating():
+    store = agent.ProtestEventStore(path=':memory:')
+    event = {**make_event("news_1", "Seattle", datetime.now(timezone.utc), source="news"),
+             "title": "Rally planned", "url": "u", "news_source": "Herald"}
+    store.upsert_events([event])
+    store.upsert_events([{**event, "title": "Rally moved to Friday"}])
+
+    stored = store.recent_events("seattle")
+    assert [e['title'] for e in stored] == ["Rally moved to Friday"]
+    assert [e['id'] for e in store.search(["friday"])] == ["news_1"]
+    assert store.search(["planned"]) == []
+
+def test_theme_engine_seeds_from_store_on_first_use():
+    store = agent.ProtestEventStore(path=':memory:')
+    store.upsert_events([
+        {**make_event(f"reddit_{i}", "Seattle", datetime.now(timezone.utc)), "title": "Transit strike", "text": ""}
+        for i in range(3)
+    ])
+    engine = agent.ThemeEngine(store=store)
+    assert engine.doc_count == 0
+
+    engine.top_themes([["transit"]])
+    engine.top_themes([["transit"]])
+    assert engine.doc_count == 3
+    assert engine.doc_freq["transit strike"] == 3
+
+def test_theme_engine_keeps_learning_new_terms_after_the_cap():
+    engine = agent.ThemeEngine(max_terms=20)
+    engine.add_document("shared_1", ["housing"])
+    engine.add_document("shared_2", ["housing"])
+    for i in range(30):
+        engine.add_document(f"doc_{i}", [f"term{i}"])
+
+    assert len(engine.doc_freq) <= 20
+    assert engine.doc_freq["housing"] == 2
+    assert engine.doc_freq["term29"] == 1
+    assert "term0" not in engine.doc_freq
+
+class FakeMoreComments:
+    """Stub whose comments() is flat, like /api/morechildren: descendants from every depth"""
+    def __init__(self, children, parent_id="t3_post"):
+        self.children = children
+        self.parent_id = parent_id
+
+    def comments(self):
+        return self.children
+
+def make_comment(comment_id, score, replies=(), parent_id="t3_post"):
+    return types.SimpleNamespace(
+        id=comment_id, parent_id=parent_id, author="tester", body=f"comment {comment_id}",
+        score=score, created_utc=1700000000, replies=list(replies)
+    )
+
+def test_comment_frontier_is_breadth_first_and_expands_stubs_last(monkeypatch):
+    monkeypatch.setattr(agent.praw.models, "MoreComments", FakeMoreComments)
+    submission = types.SimpleNamespace(score=1000, comments=[
+        make_comment("a", 50, replies=[make_comment("a_reply", 999, parent_id="t1_a")]),
+        FakeMoreComments([make_comment("c", 30), make_comment("c_reply", 500, parent_id="t1_c"),
+                          make_comment("d", 5)]),
+        make_comment("b", 40)
+    ])
+    client = types.SimpleNamespace(submission=lambda id: submission)
+    reddit_api = types.SimpleNamespace(reddit=client, thread_client=lambda: client)
+    ingestor = agent.CommentIngestor(reddit_api, per_post_api_calls=2, per_post_comments=3, max_workers=1)
+
+    result = ingestor.fetch_comments(["post"])
+
+    assert [c["id"] for c in result["comments"]["post"]] == ["a", "b", "c"]
+    assert result["budget"]["api_calls"] == 2
+
+    # Loaded comments fill a small budget before any "load more" call is spent
+    ingestor.per_post_comments = 2
+    result = ingestor.fetch_comments(["post"])
+    assert [c["id"] for c in result["comments"]["post"]] == ["a", "b"]
+    assert result["budget"]["api_calls"] == 1
+
+    # A reply in the stub's flat list is placed under its parent, one level deeper
+    ingestor.per_post_comments, ingestor.max_depth = 10, 2
+    result = ingestor.fetch_comments(["post"])
+    collected = [(c["id"], c["depth"]) for c in result["comments"]["post"]]
+    assert collected == [("a", 0), ("b", 0), ("c", 0), ("d", 0), ("a_reply", 1), ("c_reply", 1)]
+
+    ingestor.max_depth = 1
+    result = ingestor.fetch_comments(["post"])
+    assert [c["id"] for c in result["comments"]["post"]] == ["a", "b", "c", "d"]
+
+def test_escalation_detector_alerts_once_on_a_volume_spike():
+    detector = agent.EscalationDetector()
+    start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    baseline = [
+        make_event(f"base_{i}_{j}", "Seattle", start + timedelta(minutes=15 * i + j))
+        for i in range(12) for j in range(2)
+    ]
+    spike_start = start + timedelta(minutes=15 * 12)
+    spike = [make_event(f"spike_{j}", "Seattle", spike_start + timedelta(seconds=j)) for j in range(15)]
+
+    assert [alert for event in baseline for alert in detector.add_event(event)] == []
+    alerts = [alert for event in spike for alert in detector.add_event(event)]
+
+    assert [alert['metric'] for alert in alerts] == ["post_rate"]
+    assert detector.recent_alerts("seattle") == alerts
+    assert detector.recent_alerts("Portland") == []
+
+def test_merge_by_recency_interleaves_dedupes_and_stops_early():
+    start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    pulled = []
+
+    def stream(name, ids, hours):
+        for event_id, hour in zip(ids, hours):
+            pulled.append((name, event_id))
+            yield {"id": event_id, "created_at": start + timedelta(hours=hour)}
+
+    reddit = stream("reddit", ["r1", "shared", "r2", "r3", "r4"], [10, 8, 6, 1, 0])
+    news = stream("news", ["n1", "shared", "n2", "n3"], [9, 8, 2, 0])
+    merged = agent.merge_by_recency(reddit, news)
+
+    assert [item['id'] for item in agent.itertools.islice(merged, 4)] == ["r1", "n1", "shared", "r2"]
+    # Each stream is read at most one item past what was consumed
+    assert ("reddit", "r4") not in pulled and ("news", "n3") not in pulled
+
+class RecordingStopEvent:
+    """Stop event that records waits and stops the stream after a few of them"""
+    def __init__(self, max_waits):
+        self.max_waits = max_waits
+        self.waits = []
+
+    def is_set(self):
+        return len(self.waits) >= self.max_waits
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+
+def test_stream_waits_between_empty_polls():
+    polls = [None, make_submission("s1", "Rally"), None, None]
+    listing = types.SimpleNamespace(stream=types.SimpleNamespace(
+        submissions=lambda skip_existing, pause_after: iter(polls)))
+    client = types.SimpleNamespace(subreddit=lambda name: listing)
+    reddit_api = agent.RedditAPI()
+    reddit_api._reddit, reddit_api._reddit_checked = client, True
+    reddit_api.thread_client = lambda: client
+    stop_event = RecordingStopEvent(max_waits=3)
+
+    streamed = list(reddit_api.stream_submissions(["seattle"], stop_event, poll_interval=7))
+
+    assert [submission.id for submission in streamed] == ["s1"]
+    assert stop_event.waits == [7, 7, 7]
+
+def test_escalation_detector_ignores_ordinary_fresh_posts():
+    detector = agent.EscalationDetector()
+    start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    events = [
+        {**make_event(f"fresh_{i}", "Seattle", start + timedelta(minutes=8 * i)), "score": 1, "comments_count": 0}
+        for i in range(25)
+    ]
+    events.append({**make_event("fresh_25", "Seattle", start + timedelta(minutes=200)), "score": 3, "comments_count": 0})
+
+    assert [alert for event in events for alert in detector.add_event(event)] == []
+
+def test_store_fts_links_through_a_declared_rowid():
+    store = agent.ProtestEventStore(path=':memory:')
+    columns = {row['name']: row['pk'] for row in store._conn.execute("PRAGMA table_info(events)")}
+    assert columns['rowid'] == 1
+
+    event = {**make_event("reddit_1", "Seattle", datetime.now(timezone.utc)), "title": "Rally planned"}
+    store.upsert_events([event])
+    rowid = store._conn.execute("SELECT rowid FROM events WHERE id = 'reddit_1'").fetchone()[0]
+    store.upsert_events([{**event, "title": "Rally moved"}])
+
+    assert store._conn.execute("SELECT rowid FROM events WHERE id = 'reddit_1'").fetchone()[0] == rowid
+    assert [e['id'] for e in store.search(["moved"])] == ["reddit_1"]
+
+def test_enrichment_pool_keeps_order_and_restores_untruncated_text():
+    pipeline = enrichment.EnrichmentPipeline(workers=2, min_parallel=2, chunks_per_worker=2)
+    items = [("Great peaceful rally", "short"), ("Terrible violent clash", "x" * (enrichment.MAX_TEXT_LENGTH + 10)),
+             ("Quiet vigil", ""), ("Awful arrests", "bad day")] * 3
+    try:
+        results = pipeline.enrich(items)
+        assert pipeline._pool is not None
+    finally:
+        pipeline.shutdown()
+
+    assert results == [enrichment.enrich_text(title, text) for title, text in items]
+    assert results[0][1] == "short" and results[1][1].endswith("...")
+
+def test_comment_workers_reuse_their_reddit_client(monkeypatch):
+    submission = types.SimpleNamespace(score=10, comments=[make_comment("a", 5)])
+    created = []
+
+    def fake_reddit(**kwargs):
+        created.append(kwargs)
+        return types.SimpleNamespace(submission=lambda id: submission)
+
+    monkeypatch.setattr(agent.praw, "Reddit", fake_reddit)
+    reddit_api = agent.RedditAPI()
+    reddit_api.client_id, reddit_api.client_secret = "id", "secret"
+    ingestor = agent.CommentIngestor(reddit_api, max_workers=1)
+
+    for _ in range(3):
+        assert [c["id"] for c in ingestor.fetch_comments(["post"])["comments"]["post"]] == ["a"]
+
+    # One client for the main thread's credential check, one for the single worker
+    assert len(created) == 2
+
+def test_reddit_search_reads_sparse_streams_only_as_far_as_the_merge():
+    now = 1700000000
+    pulled = {}
+
+    def search(name, query):
+        def results():
+            for i in range(300):
+                pulled[(name, query)] = pulled.get((name, query), 0) + 1
+                if name == "seattle":
+                    # Local posts rarely name their own city
+                    yield make_submission(f"{name}_{query}_{i}", "Ferry schedule", subreddit=name, created_utc=now - 60 * i)
+                else:
+                    yield make_submission(f"{name}_{query}_{i}", f"Seattle {query}", subreddit=name, created_utc=now - 600 * i)
+        return results()
+
+    client = types.SimpleNamespace(subreddit=lambda name: types.SimpleNamespace(
+        search=lambda query, sort, time_filter, limit: search(name, query)))
+    reddit_api = agent.RedditAPI()
+    reddit_api._reddit, reddit_api._reddit_checked = client, True
+
+    posts = reddit_api.search_protests("Seattle", limit=20)
+
+    assert len(posts) == 20
+    assert all("Seattle" in post['title'] for post in posts)
+    assert max(count for (name, _), count in pulled.items() if name == "seattle") < 30